@@ -3,6 +3,8 @@
   @benleb / https://github.com/benleb/adutils
 """
 
+import logging
+
 from pprint import pformat
 from typing import Any, Dict, Iterable, Optional, Union
 
@@ -49,6 +51,14 @@ class ADutils:
         except Exception as error:
             print(f"Oh shit! Writing to AD logger failed: {error}")
 
+    def log_enabled(self, level: str = "INFO") -> bool:
+        try:
+            logger = self.ad.get_main_log()
+            return bool(logger.isEnabledFor(logging.getLevelName(level)))
+        except Exception:
+            # appdaemon v3 or unknown logger, assume enabled
+            return True
+
     def show_info(self) -> None:
         # check if a room is given
         room = ""
@@ -69,6 +79,8 @@ class ADutils:
 
             if isinstance(value, list):
                 self.print_collection(key, value, 2)
+            elif isinstance(value, (set, frozenset)):
+                self.print_collection(key, sorted(value), 2)
             elif isinstance(value, dict):
                 self.print_collection(key, value, 2)
             else:
@@ -10,14 +10,19 @@ ench:
     - binary_sensor.always_unavailable
   battery
     interval_min: 180
+    max_interval_min: 720
     min_level: 20
+    include_domains:
+      - sensor
+      - lock
   unavailable
     interval_min: 60
   notify: notify.me
 """
 
-from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, List, Optional, Union
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple, Union
 
 from apps.ench.adutils import adutils
 try:
@@ -34,49 +39,92 @@ APP_VERSION = "0.4.4"
 BATTERY_MIN_LEVEL = 20
 INTERVAL_BATTERY_MIN = 180
 INTERVAL_BATTERY = INTERVAL_BATTERY_MIN / 60
+INTERVAL_BATTERY_BACKOFF = 1.5
 
 INTERVAL_UNAVAILABLE_MIN = 60
 INTERVAL_UNAVAILABLE = INTERVAL_UNAVAILABLE_MIN / 60
 
+START_OFFSET_S = 120
+
 EXCLUDE = ["binary_sensor.updater", "persistent_notification.config_entry_discovery"]
-BAD_STATES = ["unavailable", "unknown"]
+BAD_STATES = frozenset(["unavailable", "unknown"])
+
+CHECKS = ("battery", "unavailable")
 
 ICONS = dict(battery="🔋", unavailable="⁉️ ", unknown="❓")
 
 
+@dataclass(frozen=True)
+class EnChCfg:
+    """Runtime configuration, fixed after initialize()."""
+
+    __slots__ = (
+        "battery_min_level",
+        "battery_include_domains",
+        "battery_interval_min",
+        "battery_max_interval_min",
+        "unavailable_interval_min",
+        "exclude",
+        "notify_service",
+        "show_friendly_name",
+    )
+
+    battery_min_level: int
+    battery_include_domains: FrozenSet[str]  # empty = all domains
+    battery_interval_min: int
+    battery_max_interval_min: int
+    unavailable_interval_min: int
+    exclude: FrozenSet[str]
+    notify_service: Optional[str]
+    show_friendly_name: bool
+
+
 class EnCh(hass.Hass):  # type: ignore
     """ench."""
 
+    _HL = "\033[1m%s\033[0m"
+
     def initialize(self) -> None:
         """Register API endpoint."""
         self.cfg: Dict[str, Any] = dict()
         self.cfg["notify"] = self.args.get("notify")
         self.cfg["show_friendly_name"] = bool(self.args.get("show_friendly_name", True))
+        self.cfg["start_offset_s"] = int(
+            self.args.get("start_offset_s", START_OFFSET_S)
+        )
+
+        # set if only the deprecated "interval" (in hours) option is used
+        legacy_interval = False
 
         # battery check
         if "battery" in self.args:
 
-            battery_cfg = self.args.get("battery")
+            battery_cfg = self.args.get("battery") or {}
 
             # temp. to be compatible with the old interval
             if "interval_min" in battery_cfg:
                 interval_min = battery_cfg.get("interval_min")
             elif "interval" in battery_cfg:
                 interval_min = battery_cfg.get("interval") * 60
+                legacy_interval = True
             else:
                 interval_min = INTERVAL_BATTERY_MIN
 
+            # optional domain allowlist, a single domain may be given as a string
+            include_domains = battery_cfg.get("include_domains") or []
+            if isinstance(include_domains, str):
+                include_domains = [include_domains]
+
             self.cfg["battery"] = dict(
                 interval_min=int(interval_min),
+                max_interval_min=max(
+                    int(battery_cfg.get("max_interval_min", interval_min)),
+                    int(interval_min),
+                ),
                 min_level=int(battery_cfg.get("min_level", BATTERY_MIN_LEVEL)),
             )
-
-            # schedule check
-            self.run_every(
-                self.check_battery,
-                self.datetime() + timedelta(seconds=120),
-                self.cfg["battery"]["interval_min"] * 60,
-            )
+            if include_domains:
+                self.cfg["battery"]["include_domains"] = sorted(set(include_domains))
 
         # unavailable check
         if self.args.get("unavailable"):
@@ -88,25 +136,63 @@ class EnCh(hass.Hass):  # type: ignore
                 interval_min = states_cfg.get("interval_min")
             elif "interval" in states_cfg:
                 interval_min = states_cfg.get("interval") * 60
+                legacy_interval = True
             else:
                 interval_min = INTERVAL_UNAVAILABLE_MIN
 
             self.cfg["unavailable"] = dict(interval_min=int(interval_min))
 
-            self.run_every(
-                self.check_unavailable,
-                self.datetime() + timedelta(seconds=120),
-                self.cfg["unavailable"]["interval_min"] * 60,
-            )
-
         # merge excluded entities
         exclude = set(EXCLUDE)
-        exclude.update([e.lower() for e in self.args.get("exclude", set())])
-        self.cfg["exclude"] = sorted(list(exclude))
+        exclude.update(self.args.get("exclude", set()))
+        self.cfg["exclude"] = frozenset(e.lower() for e in exclude)
+
+        battery = self.cfg.get("battery", {})
+        self._cfg = EnChCfg(
+            battery_min_level=battery.get("min_level", BATTERY_MIN_LEVEL),
+            battery_include_domains=frozenset(battery.get("include_domains", ())),
+            battery_interval_min=battery.get("interval_min", INTERVAL_BATTERY_MIN),
+            battery_max_interval_min=battery.get(
+                "max_interval_min", INTERVAL_BATTERY_MIN
+            ),
+            unavailable_interval_min=self.cfg.get("unavailable", {}).get(
+                "interval_min", INTERVAL_UNAVAILABLE_MIN
+            ),
+            exclude=self.cfg["exclude"],
+            notify_service=(
+                str(self.cfg["notify"]).replace(".", "/")
+                if self.cfg["notify"]
+                else None
+            ),
+            show_friendly_name=self.cfg["show_friendly_name"],
+        )
+
+        # schedule checks, one walk over all states serves every check that is due
+        intervals = dict(
+            battery=self._cfg.battery_interval_min,
+            unavailable=self._cfg.unavailable_interval_min,
+        )
+        self._interval_min: Dict[str, float] = {
+            check: interval
+            for check, interval in intervals.items()
+            if check in self.cfg
+        }
+        # seconds until each check is due, relative to the currently scheduled run
+        self._due_in_s: Dict[str, int] = {check: 0 for check in self._interval_min}
+        self._delay_s = self.cfg["start_offset_s"]
+        if self._interval_min:
+            self.run_in(self._check_all, self._delay_s)
 
         # set units
         self.cfg.setdefault(
-            "_units", dict(interval="h", interval_min="min", min_level="%")
+            "_units",
+            dict(
+                interval="h",
+                interval_min="min",
+                max_interval_min="min",
+                min_level="%",
+                start_offset_s="s",
+            ),
         )
 
         # init adutils
@@ -115,7 +201,7 @@ class EnCh(hass.Hass):  # type: ignore
         )
 
         # temp. warning bevore removing "interval"
-        if "interval" in battery_cfg:
+        if legacy_interval:
             self.adu.log(f"", icon="🧨")
             self.adu.log(
                 f" Please convert your {self.hl('interval')} (in hours) setting to {self.hl('interval_min')} (in minutes)",
@@ -129,85 +215,151 @@ class EnCh(hass.Hass):  # type: ignore
 
     def check_battery(self, _: Any) -> None:
         """Handle scheduled checks."""
-        results: List[str] = []
-
-        self.adu.log(f"Checking entities for low battery levels...", APP_ICON)
-
-        entities = filter(
-            lambda x: x.lower() not in self.cfg["exclude"], self.get_state()
-        )
-
-        for entity in sorted(entities):
-            try:
-                attrs = self.get_state(entity_id=entity, attribute="all")
-            except TypeError as error:
-                self.adu.log(f"Failed to get state for {entity}: {error}")
-
-            battery_level = attrs["attributes"].get("battery_level")
-            if battery_level and battery_level <= self.cfg["battery"]["min_level"]:
-                results.append(entity)
-                self.adu.log(
-                    f"{self._name(entity)} has low "
-                    f"{self.hl(f'battery → {self.hl(int(battery_level))}')}% | "
-                    f"last update: {self.last_update(entity)}",
-                    icon=ICONS["battery"],
-                )
-
-        # send notification
-        if self.cfg["notify"] and results:
-            self.call_service(
-                str(self.cfg["notify"]).replace(".", "/"),
-                message=f"{ICONS['battery']} Battery low ({len(results)}): "
-                f"{', '.join([e for e in results])}",
-            )
-
-        self._print_result("battery", results, "low battery levels")
+        self._check(battery=True)
 
     def check_unavailable(self, _: Any) -> None:
         """Handle scheduled checks."""
-        results: List[str] = []
-
-        self.adu.log(f"Checking entities for unavailable/unknown state...", APP_ICON)
+        self._check(unavailable=True)
+
+    def _check_all(self, _: Any) -> None:
+        """Run all checks which are due and schedule the next run."""
+        # count down by the delay this run was scheduled with
+        self._due_in_s = {
+            check: due_in_s - self._delay_s
+            for check, due_in_s in self._due_in_s.items()
+        }
+
+        due = {
+            check: check in self._due_in_s and self._due_in_s[check] <= 0
+            for check in CHECKS
+        }
+        try:
+            low_battery, _bad_state = self._check(**due)
+
+            # back off while no low batteries are found, reset on any hit
+            if due["battery"]:
+                if low_battery:
+                    self._interval_min["battery"] = self._cfg.battery_interval_min
+                else:
+                    self._interval_min["battery"] = min(
+                        self._interval_min["battery"] * INTERVAL_BATTERY_BACKOFF,
+                        self._cfg.battery_max_interval_min,
+                    )
+        finally:
+            # always arm the next run, a failed scan must not stop the schedule
+            for check, is_due in due.items():
+                if is_due:
+                    self._due_in_s[check] = int(self._interval_min[check] * 60)
+
+            # align a backed off battery check with the next unavailable check,
+            # so that a single walk over all states still serves both
+            if (
+                due["battery"]
+                and "unavailable" in self._due_in_s
+                and self._interval_min["battery"] > self._cfg.battery_interval_min
+            ):
+                battery_s = self._due_in_s["battery"]
+                unavailable_s = self._due_in_s["unavailable"]
+                interval_s = int(self._interval_min["unavailable"] * 60)
+                ticks = max(-(-(battery_s - unavailable_s) // interval_s), 0)
+                self._due_in_s["battery"] = unavailable_s + ticks * interval_s
+
+            self._delay_s = max(min(self._due_in_s.values()), 0)
+            self.run_in(self._check_all, self._delay_s)
+
+    def _check(
+        self, battery: bool = False, unavailable: bool = False
+    ) -> Tuple[List[str], List[str]]:
+        low_battery: List[str] = []
+        bad_state: List[str] = []
+
+        if battery:
+            self.adu.log(f"Checking entities for low battery levels...", APP_ICON)
+        if unavailable:
+            self.adu.log(
+                f"Checking entities for unavailable/unknown state...", APP_ICON
+            )
 
-        entities = filter(
-            lambda x: x.lower() not in self.cfg["exclude"], self.get_state()
-        )
+        exclude = self._cfg.exclude
+        min_level = self._cfg.battery_min_level
+        include_domains = self._cfg.battery_include_domains
+        bad_states = BAD_STATES
+        verbose = self.adu.log_enabled()
+        tz, today = self._timezone(), self.date()
+        all_states: Dict[str, Any] = self.get_state(attribute="all") or {}
+
+        for entity, attrs in all_states.items():
+            if entity in exclude or not attrs:
+                continue
+
+            if battery and (
+                not include_domains or entity.partition(".")[0] in include_domains
+            ):
+                battery_level = self._battery_level(attrs)
+                if battery_level is not None and battery_level <= min_level:
+                    low_battery.append(entity)
+                    if verbose:
+                        self.adu.log(
+                            f"{self._name(entity, attrs)} has low "
+                            f"{self.hl(f'battery → {int(battery_level)}')}% | "
+                            f"last update: {self.last_update(attrs, tz, today)}",
+                            icon=ICONS["battery"],
+                        )
+
+            if unavailable:
+                state = attrs.get("state")
+                if state in bad_states:
+                    bad_state.append(entity)
+                    if verbose:
+                        self.adu.log(
+                            f"{self._name(entity, attrs)} is {self.hl(state)} | "
+                            f"last update: {self.last_update(attrs, tz, today)}",
+                            icon=ICONS[state],
+                        )
+
+        if battery:
+            self._notify(
+                low_battery, f"{ICONS['battery']} Battery low", "low battery levels"
+            )
+        if unavailable:
+            self._notify(
+                bad_state,
+                f"{APP_ICON} Unavailable entities",
+                "unavailable/unknown state",
+            )
 
-        for entity in sorted(entities):
+        return low_battery, bad_state
 
-            try:
-                attributes = self.get_state(entity_id=entity, attribute="all")
-            except TypeError as error:
-                self.adu.log(f"Failed to get state for {entity}: {error}")
+    @staticmethod
+    def _battery_level(attrs: Dict[str, Any]) -> Optional[float]:
+        # some integrations report the level as a string, e.g. "7"
+        try:
+            battery_level = float(attrs.get("attributes", {}).get("battery_level"))
+        except (TypeError, ValueError):
+            return None
+        return battery_level if battery_level >= 0 else None
 
-            state = attributes.get("state")
-            if state in BAD_STATES and entity not in results:
-                results.append(entity)
-                self.adu.log(
-                    f"{self._name(entity)} is {self.hl(state)} | "
-                    f"last update: {self.last_update(entity)}",
-                    icon=ICONS[state],
-                )
+    def _notify(self, entities: List[str], title: str, reason: str) -> None:
+        entities.sort()
 
         # send notification
-        if self.cfg["notify"] and results:
+        if self._cfg.notify_service and entities:
             self.call_service(
-                str(self.cfg["notify"]).replace(".", "/"),
-                message=f"{APP_ICON} Unavailable entities ({len(results)}): "
-                f"{', '.join([e for e in results])}",
+                self._cfg.notify_service,
+                message=f"{title} ({len(entities)}): {', '.join(entities)}",
             )
 
-        self._print_result("unavailable", results, "unavailable/unknown state")
+        self._print_result(entities, reason)
 
-    def _name(self, entity: str) -> Optional[str]:
+    def _name(self, entity: str, attrs: Dict[str, Any]) -> Optional[str]:
         name: Optional[str] = None
-        if self.cfg["show_friendly_name"]:
-            name = self.friendly_name(entity)
+        if self._cfg.show_friendly_name:
+            name = attrs.get("attributes", {}).get("friendly_name", entity)
         else:
             name = self._highlight_entity(entity)
         return name
 
-    def _print_result(self, check: str, entities: List[str], reason: str) -> None:
+    def _print_result(self, entities: List[str], reason: str) -> None:
         entites_found = len(entities)
         if entites_found > 0:
             self.adu.log(
@@ -218,25 +370,38 @@ class EnCh(hass.Hass):  # type: ignore
             self.adu.log(f"no entities with {reason} found", APP_ICON)
 
     # todo  move these methods to adutils lib
-    def last_update(self, entity: str) -> str:
-        lu_date, lu_time = self._to_localtime(entity, "last_updated")
+    def last_update(self, attrs: Dict[str, Any], tz: timezone, today: date) -> str:
+        lu_date, lu_time = self._to_localtime(attrs["last_updated"], tz)
         last_updated = str(lu_time.strftime("%H:%M:%S"))
-        if lu_date != self.date():
+        if lu_date != today:
             last_updated = f"{last_updated} ({lu_date.strftime('%Y-%m-%d')})"
         return last_updated
 
-    def _to_localtime(self, entity: str, attribute: str) -> Any:
-        attributes = self.get_state(entity_id=entity, attribute="all")
-        time_utc = datetime.fromisoformat(attributes[attribute])
-        tzone = timezone(
+    def _to_localtime(self, timestamp: str, tz: timezone) -> Any:
+        # fast path for the usual "YYYY-MM-DDTHH:MM:SS[.ffffff]+00:00" format
+        if timestamp.endswith("+00:00") and len(timestamp) >= 25:
+            time_utc = datetime(
+                int(timestamp[0:4]),
+                int(timestamp[5:7]),
+                int(timestamp[8:10]),
+                int(timestamp[11:13]),
+                int(timestamp[14:16]),
+                int(timestamp[17:19]),
+                tzinfo=timezone.utc,
+            )
+        else:
+            time_utc = datetime.fromisoformat(timestamp)
+        time_local = time_utc.astimezone(tz)
+        return (time_local.date(), time_local.time())
+
+    def _timezone(self) -> timezone:
+        return timezone(
             timedelta(minutes=self.get_tz_offset()), name=self.get_timezone()
         )
-        time_local = time_utc.astimezone(tzone)
-        return (time_local.date(), time_local.time())
 
     def _highlight_entity(self, entity: str) -> str:
         domain, entity = self.split_entity(entity)
         return f"{domain}.{self.hl(entity)}"
 
     def hl(self, text: Union[int, str, None]) -> str:
-        return f"\033[1m{text}\033[0m"
+        return self._HL % text